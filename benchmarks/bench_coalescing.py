@@ -0,0 +1,60 @@
+# Load test: nhiều sinh viên hỏi cùng một câu trong vài giây (sau khi có thông báo lớp)
+#
+# Chạy (API đang chạy, cần Qdrant/MySQL/Ollama):
+#   python benchmarks/bench_coalescing.py --url http://localhost:8000 --clients 50
+#
+# So sánh số request với số lần gọi LLM (đọc từ /api/metrics trước và sau) để thấy
+# lượng LLM call tiết kiệm được nhờ gộp các câu hỏi giống nhau đang xử lý.
+# Chạy API với 1 worker: /api/metrics và việc gộp request là riêng cho từng worker.
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import requests
+
+
+def llm_calls(metrics: Dict) -> int:
+    return sum(p["calls"] for p in metrics["prompts"].values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test gộp request trùng nhau")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--spread", type=float, default=2.0,
+                        help="Các client bắt đầu rải đều trong khoảng này (giây)")
+    parser.add_argument("--query", default="Cho mình xem thời khóa biểu CLB101")
+    args = parser.parse_args()
+
+    before = requests.get(f"{args.url}/api/metrics", timeout=10).json()
+
+    def ask(i: int) -> float:
+        time.sleep(args.spread * i / args.clients)
+        # Biến thể viết hoa / khoảng trắng / dấu hỏi vẫn được gộp chung
+        query = args.query.upper() if i % 3 == 0 else f"  {args.query} ?"
+        start = time.time()
+        response = requests.post(f"{args.url}/api/query", json={"query": query}, timeout=300)
+        response.raise_for_status()
+        return time.time() - start
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        latencies = sorted(executor.map(ask, range(args.clients)))
+    elapsed = time.time() - start
+
+    after = requests.get(f"{args.url}/api/metrics", timeout=10).json()
+    calls = llm_calls(after) - llm_calls(before)
+    computations = after["coalescing"]["computations"] - before["coalescing"]["computations"]
+    coalesced = after["coalescing"]["coalesced"] - before["coalescing"]["coalesced"]
+
+    print(f"requests:       {args.clients} trong {elapsed:.1f}s")
+    print(f"computations:   {computations}")
+    print(f"coalesced:      {coalesced}")
+    print(f"llm calls:      {calls} (không gộp: ~{calls * args.clients // max(computations, 1)})")
+    print(f"latency p50/max: {latencies[len(latencies) // 2]:.2f}s / {latencies[-1]:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
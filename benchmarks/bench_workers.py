@@ -0,0 +1,175 @@
+# Benchmark chế độ multi-worker: RSS/PSS mỗi worker và requests/sec khi tăng số worker
+#
+# Chạy (Linux, cần Qdrant/MySQL/Ollama đang chạy):
+#   python benchmarks/bench_workers.py --max-workers 4 --requests 200
+#
+# PSS chia đều trang nhớ dùng chung cho các process nên phản ánh đúng lượng RAM
+# thực tế của mỗi worker khi trọng số model được chia sẻ copy-on-write.
+#
+# Hai loại tải được đo cạnh nhau:
+# - req/s (e2e): /api/query, mọi câu hỏi đi qua intent chain trên một Ollama dùng chung
+#   cho tất cả worker, nên con số này chủ yếu phản ánh throughput của Ollama
+# - req/s (no-llm): các endpoint không gọi LLM (timetable, analytics), đo khả năng mở
+#   rộng của chính các worker theo số core
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bộ câu hỏi khác nhau, phủ các intent
+DEFAULT_QUERIES = [
+    "Cho mình xem thời khóa biểu CLB101",
+    "TKB ABC123 có vi phạm gì không?",
+    "So sánh lịch CLB101 và CLB102",
+    "Đánh giá chất lượng TKB CLB102",
+    "Phòng nào quá tải trong tuần 1-4",
+    "Giảng viên nào dạy nhiều nhất học kỳ này",
+    "Làm sao để xếp lịch tránh trùng phòng?",
+]
+
+# Endpoint chỉ dùng MySQL và CPU của worker, không gọi Ollama
+NO_LLM_PATHS = [
+    "/api/schedules/CLB101/timetable",
+    "/api/schedules/CLB102/timetable?format=markdown",
+    "/api/analytics/rooms?limit=10",
+    "/api/analytics/teachers?limit=10",
+    "/api/analytics/weeks",
+]
+
+
+def child_pids(pid: int) -> List[int]:
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.extend(int(p) for p in f.read().split())
+    return children
+
+
+def memory_kb(pid: int) -> Dict[str, int]:
+    """Đọc Rss và Pss (kB) từ /proc/<pid>/smaps_rollup"""
+    result = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                result[key.lower()] = int(value.split()[0])
+    return result
+
+
+def wait_healthy(url: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    raise RuntimeError(f"Server at {url} not healthy after {timeout}s")
+
+
+def run_load(url: str, queries: List[str], total: int, concurrency: int,
+             coalesce: bool = False) -> float:
+    """Gửi `total` request với `concurrency` luồng, trả về requests/sec.
+
+    Mặc định mỗi request được đánh số riêng để không có hai câu hỏi trùng nhau
+    (server gộp các câu hỏi trùng đang xử lý), nên req/s đo đúng khả năng của worker.
+    """
+    def send(i: int):
+        query = queries[i % len(queries)]
+        if not coalesce:
+            query = f"{query} (#{i})"
+        requests.post(f"{url}/api/query", json={"query": query}, timeout=300)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(total)))
+    return total / (time.time() - start)
+
+
+def run_no_llm_load(url: str, paths: List[str], total: int, concurrency: int) -> float:
+    """Gửi `total` GET tới các endpoint không gọi LLM, trả về requests/sec"""
+    def send(i: int):
+        response = requests.get(f"{url}{paths[i % len(paths)]}", timeout=60)
+        response.raise_for_status()
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(total)))
+    return total / (time.time() - start)
+
+
+def bench(workers: int, args) -> Dict:
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), APP_PORT=str(args.port))
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    try:
+        startup = time.time()
+        wait_healthy(url, args.startup_timeout)
+        startup = time.time() - startup
+
+        concurrency = args.concurrency or workers * 2
+        rps = run_load(url, args.query or DEFAULT_QUERIES, args.requests,
+                       concurrency, args.coalesce)
+        rps_no_llm = run_no_llm_load(url, NO_LLM_PATHS, args.no_llm_requests, concurrency)
+
+        mem = [memory_kb(pid) for pid in child_pids(master.pid)]
+        return {
+            "workers": workers,
+            "startup_s": startup,
+            "rps": rps,
+            "rps_no_llm": rps_no_llm,
+            "rss_mb": sum(m["rss"] for m in mem) / len(mem) / 1024,
+            "pss_mb": sum(m["pss"] for m in mem) / len(mem) / 1024,
+            "total_pss_mb": (sum(m["pss"] for m in mem) + memory_kb(master.pid)["pss"]) / 1024,
+        }
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RSS/PSS và req/s theo số worker")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--requests", type=int, default=100,
+                        help="Số request /api/query (đi qua LLM)")
+    parser.add_argument("--no-llm-requests", type=int, default=1000,
+                        help="Số request tới các endpoint không gọi LLM")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="Số luồng gửi request (mặc định 2 x số worker)")
+    parser.add_argument("--query", action="append",
+                        help="Câu hỏi dùng để tải (lặp lại để thêm; mặc định DEFAULT_QUERIES)")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Gửi nguyên câu hỏi để server được phép gộp các request trùng")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'startup_s':>9} {'e2e req/s':>9} {'scale':>6} "
+          f"{'no-llm req/s':>12} {'scale':>6} "
+          f"{'rss_mb':>8} {'pss_mb':>8} {'total_pss_mb':>12}")
+    baseline = baseline_no_llm = None
+    for workers in range(1, args.max_workers + 1):
+        r = bench(workers, args)
+        baseline = baseline or r["rps"]
+        baseline_no_llm = baseline_no_llm or r["rps_no_llm"]
+        print(f"{r['workers']:>7} {r['startup_s']:>9.1f} {r['rps']:>9.2f} "
+              f"{r['rps'] / baseline:>6.2f} {r['rps_no_llm']:>12.2f} "
+              f"{r['rps_no_llm'] / baseline_no_llm:>6.2f} "
+              f"{r['rss_mb']:>8.0f} {r['pss_mb']:>8.0f} {r['total_pss_mb']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
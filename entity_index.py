@@ -0,0 +1,266 @@
+# Từ điển entity (TKB, môn học, phòng, giảng viên) nạp từ MySQL để nhận diện trong câu hỏi
+#
+# - Khớp chính xác: automaton Aho-Corasick trên text đã bỏ dấu, quét câu hỏi một lượt
+# - Khớp gần đúng: chỉ với tên (không với mã), điểm Dice trigram giữa tên và một cửa sổ
+#   cùng số từ trong câu hỏi; hòa điểm giữa các entity khác nhau thì bỏ (không đoán)
+# - Tự nạp lại khi số dòng hoặc updated_at của các bảng nguồn thay đổi
+
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENTITY_KINDS = ("schedule", "course", "room", "teacher")
+# Tên ngắn hơn ngưỡng này chỉ khớp chính xác
+FUZZY_MIN_LENGTH = 6
+FUZZY_THRESHOLD = 0.8
+
+
+def normalize(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt, chỉ giữ chữ/số và một khoảng trắng giữa các từ"""
+    text = unicodedata.normalize("NFD", text.lower().replace("đ", "d"))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def dice(a: Set[str], b: Set[str]) -> float:
+    """Hệ số Dice giữa hai tập trigram (đối xứng)"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def anchor_tokens(key: str) -> Set[str]:
+    """Từ phân biệt các entity cùng họ tên (A/B, 1/2, A101/A102): phải có nguyên văn khi khớp gần đúng"""
+    return {t for t in key.split() if len(t) == 1 or any(ch.isdigit() for ch in t)}
+
+
+class AhoCorasick:
+    """Automaton Aho-Corasick: tìm mọi pattern trong text với một lượt quét"""
+
+    def __init__(self, patterns: List[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+        self.patterns = patterns
+
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                if ch not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][ch] = len(self.goto) - 1
+                node = self.goto[node][ch]
+            self.output[node].append(index)
+
+        # BFS dựng liên kết fail
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text: str) -> List[Tuple[int, int]]:
+        """Trả về danh sách (vị trí kết thúc, chỉ số pattern)"""
+        matches = []
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for index in self.output[node]:
+                matches.append((pos, index))
+        return matches
+
+
+class EntityIndex:
+    """Từ điển entity trong bộ nhớ, thay mới nguyên khối khi dữ liệu MySQL thay đổi"""
+
+    def __init__(self, mysql, refresh_interval: int = 60):
+        self.mysql = mysql
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._version: Optional[tuple] = None
+        self._checked_at = 0.0
+        # key đã chuẩn hóa -> danh sách (kind, code)
+        self._entries: Dict[str, List[Tuple[str, str]]] = {}
+        self._automaton = AhoCorasick([])
+        self._keys: List[str] = []
+        # Chỉ tên (không phải mã) đủ dài mới có trong index trigram
+        self._postings: Dict[str, List[int]] = {}
+        self._key_trigrams: Dict[int, Set[str]] = {}
+
+    def refresh(self, force: bool = False):
+        """Nạp lại từ điển nếu dữ liệu nguồn đã đổi"""
+        version = tuple(
+            (r["source"], r["total"], r["changed"]) for r in self.mysql.stream_entity_version()
+        )
+        if not force and version == self._version:
+            return
+
+        entries: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+        names: Set[str] = set()
+        for row in self.mysql.stream_entities():
+            for alias in (row["code"], row["name"]):
+                key = normalize(alias or "")
+                if key and (row["kind"], row["code"]) not in entries[key]:
+                    entries[key].append((row["kind"], row["code"]))
+            name = normalize(row["name"] or "")
+            if name and name != normalize(row["code"]):
+                names.add(name)
+
+        keys = list(entries)
+        postings: Dict[str, List[int]] = defaultdict(list)
+        key_trigrams: Dict[int, Set[str]] = {}
+        for index, key in enumerate(keys):
+            if key not in names or len(key) < FUZZY_MIN_LENGTH:
+                continue
+            key_trigrams[index] = trigrams(key)
+            for gram in key_trigrams[index]:
+                postings[gram].append(index)
+
+        # Pattern có khoảng trắng hai đầu để chỉ khớp trọn từ
+        automaton = AhoCorasick([f" {key} " for key in keys])
+
+        with self._lock:
+            self._entries = dict(entries)
+            self._keys = keys
+            self._automaton = automaton
+            self._postings = dict(postings)
+            self._key_trigrams = key_trigrams
+            self._version = version
+        logger.info(f"Entity index loaded: {len(keys)} keys")
+
+    def maybe_refresh(self):
+        """Kiểm tra thay đổi dữ liệu, tối đa một lần mỗi refresh_interval giây"""
+        now = time.time()
+        if now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"Entity index refresh failed: {e}")
+
+    def resolve(self, query: str) -> Dict[str, List[Dict]]:
+        """Nhận diện mọi entity trong câu hỏi, theo thứ tự xuất hiện"""
+        self.maybe_refresh()
+        with self._lock:
+            entries, keys = self._entries, self._keys
+            automaton = self._automaton
+            postings, key_trigrams = self._postings, self._key_trigrams
+
+        text = f" {normalize(query)} "
+
+        # Khớp chính xác, ưu tiên match dài hơn khi chồng lấn
+        spans = []
+        for end, index in automaton.find(text):
+            pattern = automaton.patterns[index]
+            spans.append((end - len(pattern) + 1, end, index))
+        spans.sort(key=lambda s: (s[0], -(s[1] - s[0])))
+
+        resolved: Dict[str, List[Dict]] = {kind: [] for kind in ENTITY_KINDS}
+        seen: Set[Tuple[str, str]] = set()
+        # Ký tự đã khớp chính xác thay bằng \0 để tách câu hỏi thành các đoạn còn lại
+        residual = list(text)
+        last_end = -1
+        for start, end, index in spans:
+            # Pattern dùng chung khoảng trắng biên với match liền kề
+            if start < last_end:
+                continue
+            last_end = end
+            residual[start + 1:end] = "\0" * (end - start - 1)
+            for kind, code in entries[keys[index]]:
+                if (kind, code) not in seen:
+                    seen.add((kind, code))
+                    resolved[kind].append({"code": code, "matched": keys[index], "score": 1.0})
+
+        segments = [seg.split() for seg in "".join(residual).split("\0")]
+        for score, index in self._fuzzy(segments, entries, keys, postings, key_trigrams):
+            for kind, code in entries[keys[index]]:
+                if (kind, code) not in seen:
+                    seen.add((kind, code))
+                    resolved[kind].append({"code": code, "matched": keys[index], "score": score})
+
+        return resolved
+
+    @staticmethod
+    def _fuzzy(segments: List[List[str]], entries: Dict[str, List[Tuple[str, str]]],
+               keys: List[str], postings: Dict[str, List[int]],
+               key_trigrams: Dict[int, Set[str]]) -> List[Tuple[float, int]]:
+        """Khớp gần đúng tên entity với các cửa sổ từ trong phần câu hỏi chưa khớp chính xác.
+
+        Trả về (điểm, chỉ số key) theo thứ tự xuất hiện trong câu hỏi.
+        """
+        query_grams: Set[str] = set()
+        for tokens in segments:
+            query_grams |= trigrams(" ".join(tokens))
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for index in postings.get(gram, ()):
+                shared[index] += 1
+
+        # (điểm, (đoạn, từ đầu, từ cuối), chỉ số key) của cửa sổ tốt nhất cho mỗi tên
+        candidates = []
+        for index, count in shared.items():
+            grams = key_trigrams[index]
+            # Cận trên của Dice với mọi cửa sổ: loại sớm tên không thể đạt ngưỡng
+            if 2 * count / (len(grams) + count) < FUZZY_THRESHOLD:
+                continue
+            key = keys[index]
+            anchors = anchor_tokens(key)
+            size = len(key.split())
+            best = None
+            for seg, tokens in enumerate(segments):
+                for width in (size - 1, size, size + 1):
+                    for start in range(len(tokens) - width + 1 if width > 0 else 0):
+                        window = tokens[start:start + width]
+                        if not anchors.issubset(window):
+                            continue
+                        score = round(dice(grams, trigrams(" ".join(window))), 3)
+                        if best is None or score > best[0]:
+                            best = (score, (seg, start, start + width))
+            if best and best[0] >= FUZZY_THRESHOLD:
+                candidates.append((best[0], best[1], index))
+
+        def overlaps(a, b):
+            return a[0] == b[0] and a[1] < b[2] and b[1] < a[2]
+
+        # Điểm cao nhận đoạn câu hỏi trước; hòa điểm trên cùng đoạn hoặc một tên
+        # ứng với nhiều entity cùng loại thì không đoán, đoạn đó bị bỏ
+        candidates.sort(key=lambda c: -c[0])
+        taken = []
+        matched = []
+        for score, span, index in candidates:
+            if any(overlaps(span, t) for t in taken):
+                continue
+            taken.append(span)
+            rivals = [c for c in candidates
+                      if c[0] == score and c[2] != index and overlaps(c[1], span)]
+            kinds = [kind for kind, _ in entries[keys[index]]]
+            if rivals or len(kinds) != len(set(kinds)):
+                logger.debug(f"Ambiguous fuzzy match for {keys[index]!r}, skipped")
+                continue
+            matched.append((span, score, index))
+        return [(score, index) for _, score, index in sorted(matched)]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"keys": len(self._keys), "states": len(self._automaton.goto)}
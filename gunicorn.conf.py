@@ -0,0 +1,33 @@
+# Cấu hình gunicorn cho chế độ multi-worker
+# Chạy: gunicorn -c gunicorn.conf.py main:app
+#
+# Master process nạp embedding model một lần rồi fork các uvicorn worker,
+# trọng số model được chia sẻ copy-on-write giữa các worker. Kết nối Qdrant,
+# MySQL và Ollama vẫn được mở riêng trong lifespan của từng worker.
+
+import gc
+import multiprocessing
+import os
+
+from rag_chatbot import Config, preload_models
+
+bind = f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', 8000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("OLLAMA_TIMEOUT", 120)) + 30
+
+# Mỗi worker chỉ dùng ít thread torch để N worker không tranh nhau N x cores
+torch_threads = int(os.getenv("TORCH_NUM_THREADS", 1))
+
+
+def on_starting(server):
+    preload_models(Config())
+    # Đưa các object đã nạp ra khỏi GC để GC của worker không ghi vào
+    # (và làm copy) các trang nhớ dùng chung
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+    torch.set_num_threads(torch_threads)
@@ -22,7 +22,8 @@ CREATE TABLE schedules (
     metadata JSON,
     INDEX idx_schedule_code (schedule_code),
     INDEX idx_week (week),
-    INDEX idx_status (status)
+    INDEX idx_status (status),
+    INDEX idx_updated (updated_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
@@ -35,6 +36,7 @@ CREATE TABLE courses (
     course_type ENUM('theory', 'practical', 'lab') DEFAULT 'theory',
     credits INT,
     department VARCHAR(100),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_course_code (course_code)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -50,6 +52,7 @@ CREATE TABLE rooms (
     building VARCHAR(100),
     floor INT,
     facilities JSON,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_room_code (room_code),
     INDEX idx_capacity (capacity)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -65,6 +68,7 @@ CREATE TABLE teachers (
     department VARCHAR(100),
     max_hours_per_week INT DEFAULT 40,
     preferences JSON,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_teacher_code (teacher_code)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -116,8 +120,10 @@ CREATE TABLE constraints (
     severity ENUM('low', 'medium', 'high') DEFAULT 'medium',
     description TEXT,
     weight DECIMAL(5,2) DEFAULT 1.0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_constraint_code (constraint_code),
-    INDEX idx_type_severity (constraint_type, severity)
+    INDEX idx_type_severity (constraint_type, severity),
+    INDEX idx_updated (updated_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
@@ -148,8 +154,10 @@ CREATE TABLE metrics (
     metric_value DECIMAL(10,4),
     metric_category VARCHAR(50),
     calculated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (schedule_code) REFERENCES schedules(schedule_code) ON DELETE CASCADE,
-    INDEX idx_schedule_metric (schedule_code, metric_name)
+    INDEX idx_schedule_metric (schedule_code, metric_name),
+    INDEX idx_updated (updated_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ============================================
@@ -169,6 +177,35 @@ CREATE TABLE chat_history (
     INDEX idx_created (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- ============================================
+-- Bảng Schedule_Versions (Phiên bản dữ liệu render TKB, ghi bởi trigger)
+-- ============================================
+CREATE TABLE schedule_versions (
+    schedule_id INT PRIMARY KEY,
+    version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    FOREIGN KEY (schedule_id) REFERENCES schedules(schedule_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- Bảng Sync_State (Watermark đồng bộ Qdrant)
+-- ============================================
+CREATE TABLE sync_state (
+    source VARCHAR(50) PRIMARY KEY,
+    watermark TIMESTAMP NULL,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ============================================
+-- Bảng Sync_Deletions (Hàng đợi các dòng đã xóa, ghi bởi trigger)
+-- ============================================
+CREATE TABLE sync_deletions (
+    deletion_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    source VARCHAR(50) NOT NULL,
+    source_id INT NOT NULL,
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_source (source, deletion_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- ============================================
 -- Sample Data (Dữ liệu mẫu)
 -- ============================================
@@ -245,10 +282,9 @@ SELECT
     COUNT(DISTINCT sc.course_id) as total_courses,
     COUNT(DISTINCT sc.room_id) as total_rooms,
     COUNT(DISTINCT sc.teacher_id) as total_teachers,
-    COUNT(v.violation_id) as total_violations
+    (SELECT COUNT(*) FROM violations v WHERE v.schedule_code = s.schedule_code) as total_violations
 FROM schedules s
 LEFT JOIN schedule_courses sc ON s.schedule_id = sc.schedule_id
-LEFT JOIN violations v ON s.schedule_code = v.schedule_code
 GROUP BY s.schedule_id;
 
 CREATE VIEW v_room_utilization AS
@@ -272,6 +308,82 @@ CREATE INDEX idx_schedule_course_lookup ON schedule_courses(schedule_id, day_of_
 CREATE INDEX idx_violation_lookup ON violations(schedule_code, constraint_id, detected_at);
 CREATE INDEX idx_metric_lookup ON metrics(schedule_code, metric_name, calculated_at);
 
+-- Covering indexes cho analytics theo phòng / giảng viên (không cần đọc bảng gốc)
+CREATE INDEX idx_schedule_status_week ON schedules(status, week);
+CREATE INDEX idx_schedule_course_room_load ON schedule_courses(schedule_id, room_id, start_time, end_time);
+CREATE INDEX idx_schedule_course_teacher_load ON schedule_courses(schedule_id, teacher_id, start_time, end_time);
+
+-- ============================================
+-- Triggers
+-- ============================================
+
+-- Tăng schedule_versions.version khi bất kỳ dữ liệu nào xuất hiện trong TKB đã render
+-- thay đổi (cache timetable dựa vào cột này). Dùng bộ đếm thay vì updated_at vì TIMESTAMP
+-- chỉ chính xác tới giây: hai thay đổi trong cùng một giây sẽ không được nhận ra.
+-- Bộ đếm nằm ở bảng riêng: trigger không được ghi vào bảng mà câu lệnh gọi nó đang dùng
+-- (ERROR 1442, vd. INSERT INTO schedule_courses ... SELECT ... FROM schedules), và ghi vào
+-- schedules sẽ đổi updated_at, làm qdrant_sync và từ điển entity nạp lại không cần thiết.
+CREATE TRIGGER trg_schedules_version AFTER UPDATE ON schedules
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version) VALUES (NEW.schedule_id, 1)
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_schedule_courses_insert AFTER INSERT ON schedule_courses
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version) VALUES (NEW.schedule_id, 1)
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_schedule_courses_update AFTER UPDATE ON schedule_courses
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version) VALUES (OLD.schedule_id, 1), (NEW.schedule_id, 1)
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_schedule_courses_delete AFTER DELETE ON schedule_courses
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version) VALUES (OLD.schedule_id, 1)
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_schedule_rooms_insert AFTER INSERT ON schedule_rooms
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version) VALUES (NEW.schedule_id, 1)
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_schedule_rooms_update AFTER UPDATE ON schedule_rooms
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version) VALUES (OLD.schedule_id, 1), (NEW.schedule_id, 1)
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_schedule_rooms_delete AFTER DELETE ON schedule_rooms
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version) VALUES (OLD.schedule_id, 1)
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+-- Môn học, giảng viên, phòng không xóa được khi còn được tham chiếu (FK), chỉ cần bắt UPDATE
+CREATE TRIGGER trg_courses_update AFTER UPDATE ON courses
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version)
+SELECT DISTINCT schedule_id, 1 FROM schedule_courses WHERE course_id = NEW.course_id
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_teachers_update AFTER UPDATE ON teachers
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version)
+SELECT DISTINCT schedule_id, 1 FROM schedule_courses WHERE teacher_id = NEW.teacher_id
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+CREATE TRIGGER trg_rooms_update AFTER UPDATE ON rooms
+FOR EACH ROW INSERT INTO schedule_versions (schedule_id, version)
+SELECT schedule_id, 1 FROM schedule_courses WHERE room_id = NEW.room_id
+UNION SELECT schedule_id, 1 FROM schedule_rooms WHERE room_id = NEW.room_id
+ON DUPLICATE KEY UPDATE version = version + 1;
+
+-- Ghi các dòng bị xóa vào sync_deletions để qdrant_sync.py xóa point tương ứng
+-- mà không phải quét lại toàn bộ bảng. Xóa theo ON DELETE CASCADE không kích hoạt
+-- trigger của bảng con, nên metrics của TKB bị xóa được ghi ngay từ trigger của schedules.
+CREATE TRIGGER trg_constraints_delete AFTER DELETE ON constraints
+FOR EACH ROW INSERT INTO sync_deletions (source, source_id) VALUES ('constraints', OLD.constraint_id);
+
+CREATE TRIGGER trg_metrics_delete AFTER DELETE ON metrics
+FOR EACH ROW INSERT INTO sync_deletions (source, source_id) VALUES ('metrics', OLD.metric_id);
+
+CREATE TRIGGER trg_schedules_delete_metrics BEFORE DELETE ON schedules
+FOR EACH ROW INSERT INTO sync_deletions (source, source_id)
+SELECT 'metrics', metric_id FROM metrics WHERE schedule_code = OLD.schedule_code;
+
+CREATE TRIGGER trg_schedules_delete AFTER DELETE ON schedules
+FOR EACH ROW INSERT INTO sync_deletions (source, source_id) VALUES ('schedules', OLD.schedule_id);
+
 -- ============================================
 -- End of Schema
 -- ============================================
\ No newline at end of file
@@ -1,12 +1,19 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.concurrency import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import asynccontextmanager, run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+from decimal import Decimal
+import asyncio
+import itertools
+import json
 import logging
 from rag_chatbot import ScheduleRAGChatbot, Config, IntentType
+from qdrant_sync import QdrantSync, run_periodic
 # Initialize chatbot
 config = Config()
 chatbot = None
+qdrant_sync = None
 
 # @asynccontextmanager
 # async def lifespan(app: FastAPI):
@@ -20,7 +27,8 @@ chatbot = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global chatbot
+    global chatbot, qdrant_sync
+    sync_task = None
     try:
         logger.info("🚀 Lifespan startup triggered")
         logger.info("Initializing chatbot...")
@@ -29,12 +37,21 @@ async def lifespan(app: FastAPI):
         chatbot.initialize()
 
         logger.info("✅ Chatbot initialized successfully")
+
+        qdrant_sync = QdrantSync(config, chatbot.qdrant, chatbot.mysql)
+        if config.qdrant_sync_interval > 0:
+            sync_task = asyncio.create_task(
+                run_periodic(qdrant_sync, config.qdrant_sync_interval)
+            )
+            logger.info(f"Qdrant sync scheduled every {config.qdrant_sync_interval}s")
     except Exception as e:
         logger.error(f"❌ Failed to initialize chatbot: {e}")
 
     # very important
     yield
 
+    if sync_task:
+        sync_task.cancel()
     logger.info("🛑 Application shutdown")
 
 # app = FastAPI(lifespan=lifespan)
@@ -86,7 +103,10 @@ async def root():
         "endpoints": {
             "health": "/health",
             "query": "/api/query",
-            "intents": "/api/intents"
+            "intents": "/api/intents",
+            "metrics": "/api/metrics",
+            "timetable": "/api/schedules/{schedule_code}/timetable",
+            "analytics": "/api/analytics/{dimension}"
         }
     }
 
@@ -109,7 +129,12 @@ async def health_check():
     
     try:
         # Check MySQL
-        chatbot.mysql.connection.ping(reconnect=True)
+        # Không chờ lock: connection đang được một request khác dùng tức là vẫn sống
+        if chatbot.mysql.lock.acquire(blocking=False):
+            try:
+                chatbot.mysql.connection.ping(reconnect=True)
+            finally:
+                chatbot.mysql.lock.release()
         services["mysql"] = True
     except:
         pass
@@ -132,11 +157,10 @@ async def process_query(request: QueryRequest):
         raise HTTPException(status_code=503, detail="Chatbot not initialized")
     
     try:
-        # Detect intent
-        intent_result = chatbot.intent_detector.detect(request.query)
-        
-        # Process query
-        response = chatbot.process_query(request.query)
+        # Câu hỏi trùng với câu đang xử lý chờ trong event loop, không chiếm thread
+        result = await chatbot.answer(request.query)
+        intent_result = result["intent_result"]
+        response = result["response"]
         
         return QueryResponse(
             query=request.query,
@@ -173,10 +197,88 @@ async def get_intents():
             {
                 "name": IntentType.SCHEDULE_COMPARISON.value,
                 "description": "So sánh các TKB"
+            },
+            {
+                "name": IntentType.SCHEDULE_ANALYTICS.value,
+                "description": "Thống kê tổng hợp theo tuần, phòng, giảng viên"
             }
         ]
     }
 
+@app.get("/api/schedules/{schedule_code}/timetable", tags=["Schedules"])
+async def get_timetable(schedule_code: str, format: str = "json"):
+    if not chatbot:
+        raise HTTPException(status_code=503, detail="Chatbot not initialized")
+
+    timetable = await run_in_threadpool(chatbot.get_timetable, schedule_code)
+    if not timetable:
+        raise HTTPException(status_code=404, detail=f"Schedule {schedule_code} not found")
+
+    if format == "markdown":
+        return {"schedule_code": schedule_code, "markdown": timetable["markdown"]}
+    return timetable["json"]
+
+@app.get("/api/analytics/{dimension}", tags=["Schedules"])
+async def get_analytics(dimension: str,
+                        week_from: Optional[int] = Query(None, ge=1, le=53),
+                        week_to: Optional[int] = Query(None, ge=1, le=53),
+                        limit: int = Query(100, ge=1, le=1000),
+                        ascending: bool = False):
+    if not chatbot:
+        raise HTTPException(status_code=503, detail="Chatbot not initialized")
+
+    # Chỉ có week_to: tính từ tuần 1; chỉ có week_from: một tuần
+    if week_from is None and week_to is not None:
+        week_from = 1
+    if week_from is not None and week_to is None:
+        week_to = week_from
+    if week_from is not None and week_from > week_to:
+        raise HTTPException(status_code=422, detail="week_from must not be greater than week_to")
+    batch_size = config.analytics_batch_size
+
+    if dimension == "rooms":
+        rows = chatbot.mysql.stream_room_load(week_from, week_to, limit, ascending, batch_size)
+    elif dimension == "teachers":
+        rows = chatbot.mysql.stream_teacher_load(week_from, week_to, limit, ascending, batch_size)
+    elif dimension == "weeks":
+        rows = chatbot.mysql.stream_weekly_summary(week_from, week_to, batch_size)
+    else:
+        raise HTTPException(status_code=404, detail=f"Unknown dimension {dimension}")
+
+    # Chạy query và đọc dòng đầu trước khi gửi header 200: lỗi MySQL trả về mã lỗi
+    # thay vì một response 200 bị cắt giữa chừng
+    try:
+        first = await run_in_threadpool(next, rows, None)
+    except Exception as e:
+        logger.error(f"Analytics query failed: {e}")
+        raise HTTPException(status_code=503, detail=f"Analytics query failed: {e}")
+    if first is not None:
+        rows = itertools.chain([first], rows)
+
+    def to_json(value):
+        return float(value) if isinstance(value, Decimal) else str(value)
+
+    # Trả về NDJSON, mỗi dòng một kết quả, đọc dần từ cursor
+    return StreamingResponse(
+        (json.dumps(row, ensure_ascii=False, default=to_json) + "\n" for row in rows),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/api/metrics", tags=["General"])
+async def get_metrics():
+    if not chatbot:
+        raise HTTPException(status_code=503, detail="Chatbot not initialized")
+
+    # TTFT và số token prompt của từng template: cold = warmup lúc khởi động, warm = lần gọi thật
+    return {
+        "prompts": chatbot.prompts.stats(),
+        "intent": chatbot.intent_detector.stats.report(),
+        "timetable_cache": chatbot.timetables.stats(),
+        "entity_index": chatbot.entities.stats(),
+        "coalescing": chatbot.inflight.stats(),
+        "qdrant_sync": qdrant_sync.last_run if qdrant_sync else None
+    }
+
 @app.post("/api/feedback", tags=["Chat"])
 async def submit_feedback(query: str, response: str, rating: int):
     # Log feedback for improvement
@@ -0,0 +1,360 @@
+# Đồng bộ tăng dần dữ liệu MySQL (constraints, metrics, schedules) sang Qdrant
+#
+# Chạy một lần:      python qdrant_sync.py
+# Chạy định kỳ:      đặt QDRANT_SYNC_INTERVAL (giây) > 0, API sẽ chạy job nền trong lifespan
+#
+# Đối chiếu toàn bộ:  python qdrant_sync.py --reconcile (lần đầu, hoặc khi nghi lệch dữ liệu)
+#
+# Mỗi bảng có một watermark (cột thời gian thay đổi) lưu trong bảng sync_state.
+# Chỉ các dòng mới/đổi từ watermark trở đi được embed lại; point ID sinh ổn định
+# từ khóa chính nên upsert lặp lại không tạo bản trùng. Dòng bị xóa được trigger ghi
+# vào bảng sync_deletions; mỗi lần sync chỉ xóa các point trong hàng đợi đó.
+
+import argparse
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from qdrant_client.models import (
+    FieldCondition, Filter, FilterSelector, MatchValue, PointIdsList, PointStruct
+)
+
+from rag_chatbot import Config, MySQLManager, QdrantManager, logger
+
+SYNC_LOCK_NAME = "qdrant_sync"
+# TIMESTAMP của MySQL không lưu được giá trị nhỏ hơn mốc này
+MIN_WATERMARK = datetime(1970, 1, 2)
+POINT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "xeptkb-chatbot/qdrant-sync")
+
+
+@dataclass
+class SyncSource:
+    """Một bảng MySQL được đồng bộ sang một collection Qdrant"""
+    table: str
+    id_column: str
+    changed_column: str
+    collection: str
+    # SELECT các dòng có changed_column >= %s
+    query: str
+    to_text: Callable[[Dict], str]
+    to_payload: Callable[[Dict], Dict]
+
+
+def point_id(table: str, row_id: int) -> str:
+    """ID ổn định của point ứng với một dòng MySQL"""
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{table}:{row_id}"))
+
+
+def sync_sources(config: Config) -> List[SyncSource]:
+    return [
+        SyncSource(
+            table="constraints",
+            id_column="constraint_id",
+            changed_column="updated_at",
+            collection=config.constraints_collection,
+            query="""
+                SELECT constraint_id, constraint_code, constraint_name, constraint_type,
+                       severity, description, weight, updated_at
+                FROM constraints
+                WHERE updated_at >= %s
+                ORDER BY updated_at
+            """,
+            to_text=lambda r: f"{r['constraint_name']}: {r['description'] or ''}",
+            to_payload=lambda r: {
+                "type": "constraint",
+                "code": r["constraint_code"],
+                "name": r["constraint_name"],
+                "constraint_type": r["constraint_type"],
+                "severity": r["severity"],
+                "weight": float(r["weight"]) if r["weight"] is not None else None,
+            },
+        ),
+        SyncSource(
+            table="metrics",
+            id_column="metric_id",
+            changed_column="updated_at",
+            collection=config.metric_values_collection,
+            query="""
+                SELECT metric_id, schedule_code, metric_name, metric_value,
+                       metric_category, updated_at
+                FROM metrics
+                WHERE updated_at >= %s
+                ORDER BY updated_at
+            """,
+            to_text=lambda r: (
+                f"TKB {r['schedule_code']} - metric {r['metric_name']} "
+                f"({r['metric_category'] or 'N/A'}): {r['metric_value']}"
+            ),
+            to_payload=lambda r: {
+                "type": "metric_value",
+                "schedule_code": r["schedule_code"],
+                "name": r["metric_name"],
+                "category": r["metric_category"],
+                "value": float(r["metric_value"]) if r["metric_value"] is not None else None,
+            },
+        ),
+        SyncSource(
+            table="schedules",
+            id_column="schedule_id",
+            changed_column="updated_at",
+            collection=config.docs_collection,
+            query="""
+                SELECT schedule_id, schedule_code, schedule_name, week, semester,
+                       academic_year, status, quality_score, updated_at
+                FROM schedules
+                WHERE updated_at >= %s
+                ORDER BY updated_at
+            """,
+            to_text=lambda r: (
+                f"{r['schedule_name'] or r['schedule_code']} ({r['schedule_code']}): "
+                f"tuần {r['week']}, học kỳ {r['semester']} {r['academic_year']}, "
+                f"trạng thái {r['status']}, điểm chất lượng {r['quality_score']}"
+            ),
+            to_payload=lambda r: {
+                "type": "schedule",
+                "schedule_code": r["schedule_code"],
+                "week": r["week"],
+                "status": r["status"],
+            },
+        ),
+    ]
+
+
+class QdrantSync:
+    def __init__(self, config: Config, qdrant: QdrantManager, mysql: MySQLManager):
+        self.config = config
+        self.qdrant = qdrant
+        self.mysql = mysql
+        self.sources = sync_sources(config)
+        self.last_run: Optional[Dict] = None
+
+    def run_once(self) -> Dict[str, Dict[str, int]]:
+        """Đồng bộ tất cả các bảng; bỏ qua nếu process khác đang chạy sync"""
+        connection = self.mysql.open_connection()
+        try:
+            cursor = connection.cursor(buffered=True)
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (SYNC_LOCK_NAME,))
+            if cursor.fetchone()[0] != 1:
+                logger.info("Qdrant sync already running in another process, skipped")
+                return {}
+
+            try:
+                started = time.time()
+                result = {
+                    source.table: self._sync_source(connection, source)
+                    for source in self.sources
+                }
+                self.last_run = {
+                    "finished_at": datetime.now().isoformat(),
+                    "duration_s": time.time() - started,
+                    "sources": result,
+                }
+                logger.info(f"Qdrant sync finished: {result}")
+                return result
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (SYNC_LOCK_NAME,))
+                cursor.fetchone()
+        finally:
+            connection.close()
+
+    def _sync_source(self, connection, source: SyncSource) -> Dict[str, int]:
+        watermark = self._get_watermark(connection, source.table)
+        # updated_at được gán lúc câu lệnh chạy, không phải lúc commit: dòng của transaction
+        # chưa commit khi đọc có thể mang updated_at nhỏ hơn các dòng đã đọc. Watermark không
+        # vượt quá (thời điểm bắt đầu đọc - lag) để các dòng đó được đọc lại ở lần sau.
+        settled = self._db_now(connection) - timedelta(seconds=self.config.sync_watermark_lag)
+        new_watermark = watermark
+        upserted = 0
+
+        # >= watermark: các dòng cùng giây với lần sync trước được embed lại (upsert idempotent)
+        batch: List[Dict] = []
+        for row in self.mysql.stream(source.query, (watermark,), self.config.sync_batch_size):
+            batch.append(row)
+            if len(batch) >= self.config.sync_batch_size:
+                upserted += self._upsert_batch(source, batch)
+                batch = []
+            new_watermark = max(new_watermark, row[source.changed_column])
+        if batch:
+            upserted += self._upsert_batch(source, batch)
+
+        deleted = self._delete_removed(connection, source)
+
+        new_watermark = max(watermark, min(new_watermark, settled))
+        if new_watermark != watermark:
+            self._save_watermark(connection, source.table, new_watermark)
+        return {"upserted": upserted, "deleted": deleted}
+
+    def _upsert_batch(self, source: SyncSource, rows: List[Dict]) -> int:
+        started = time.time()
+        texts = [source.to_text(r) for r in rows]
+        vectors = self.qdrant.embedding_model.encode(
+            texts, batch_size=self.config.sync_batch_size
+        )
+        points = [
+            PointStruct(
+                id=point_id(source.table, r[source.id_column]),
+                vector=vector.tolist(),
+                payload={
+                    "text": text,
+                    "source": source.table,
+                    "source_id": r[source.id_column],
+                    **source.to_payload(r),
+                },
+            )
+            for r, text, vector in zip(rows, texts, vectors)
+        ]
+        self.qdrant.client.upsert(collection_name=source.collection, points=points)
+        self._throttle(time.time() - started)
+        return len(points)
+
+    def _delete_removed(self, connection, source: SyncSource) -> int:
+        """Xóa các point của dòng đã xóa theo hàng đợi sync_deletions"""
+        # Không dùng con trỏ deletion_id: giao dịch xóa commit không theo thứ tự id,
+        # mục nào đã xử lý thì xóa khỏi hàng đợi, mục commit muộn còn lại cho lần sau
+        query = """
+            SELECT deletion_id, source_id FROM sync_deletions
+            WHERE source = %s
+            ORDER BY deletion_id
+        """
+        deleted = 0
+        batch: List[Dict] = []
+        for row in self.mysql.stream(query, (source.table,), 1000):
+            batch.append(row)
+            if len(batch) >= 1000:
+                deleted += self._delete_batch(connection, source, batch)
+                batch = []
+        if batch:
+            deleted += self._delete_batch(connection, source, batch)
+        return deleted
+
+    def _delete_batch(self, connection, source: SyncSource, rows: List[Dict]) -> int:
+        points = list({point_id(source.table, r["source_id"]) for r in rows})
+        self.qdrant.client.delete(
+            collection_name=source.collection,
+            points_selector=PointIdsList(points=points),
+        )
+        cursor = connection.cursor()
+        cursor.execute(
+            f"DELETE FROM sync_deletions WHERE deletion_id IN ({', '.join(['%s'] * len(rows))})",
+            tuple(r["deletion_id"] for r in rows)
+        )
+        connection.commit()
+        return len(points)
+
+    def reconcile(self) -> Dict[str, int]:
+        """Đối chiếu toàn bộ point với khóa chính MySQL, xóa point mồ côi.
+
+        Chỉ cần khi hàng đợi sync_deletions chưa có (dữ liệu cũ) hoặc bị bỏ qua;
+        quét hết bảng và collection nên không chạy trong job định kỳ.
+        """
+        return {source.table: self._reconcile_source(source) for source in self.sources}
+
+    def _reconcile_source(self, source: SyncSource) -> int:
+        expected = {
+            point_id(source.table, r[source.id_column])
+            for r in self.mysql.stream(
+                f"SELECT {source.id_column} FROM {source.table}", (), 1000
+            )
+        }
+
+        stale = []
+        source_filter = Filter(must=[
+            FieldCondition(key="source", match=MatchValue(value=source.table))
+        ])
+        offset = None
+        while True:
+            points, offset = self.qdrant.client.scroll(
+                collection_name=source.collection,
+                scroll_filter=source_filter,
+                limit=1000,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+            stale.extend(p.id for p in points if str(p.id) not in expected)
+            if offset is None:
+                break
+
+        if stale:
+            self.qdrant.client.delete(
+                collection_name=source.collection,
+                points_selector=PointIdsList(points=stale),
+            )
+
+        # Point của bảng này nằm nhầm collection (vd. giá trị metric trước đây ghi vào
+        # collection định nghĩa metric) làm bẩn kết quả search ở đó
+        others = {s.collection for s in self.sources} | {self.config.metrics_collection}
+        for collection in others - {source.collection}:
+            self.qdrant.client.delete(
+                collection_name=collection,
+                points_selector=FilterSelector(filter=source_filter),
+            )
+        return len(stale)
+
+    def _throttle(self, busy_seconds: float):
+        # Giữ CPU dùng cho sync quanh sync_cpu_fraction: nghỉ tương ứng sau mỗi batch
+        fraction = self.config.sync_cpu_fraction
+        if 0 < fraction < 1:
+            time.sleep(busy_seconds * (1 - fraction) / fraction)
+
+    @staticmethod
+    def _db_now(connection) -> datetime:
+        # Giờ của MySQL, cùng nguồn với updated_at
+        cursor = connection.cursor(buffered=True)
+        cursor.execute("SELECT NOW()")
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def _get_watermark(connection, table: str) -> datetime:
+        cursor = connection.cursor(buffered=True)
+        cursor.execute("SELECT watermark FROM sync_state WHERE source = %s", (table,))
+        row = cursor.fetchone()
+        return row[0] if row and row[0] else MIN_WATERMARK
+
+    @staticmethod
+    def _save_watermark(connection, table: str, watermark: datetime):
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            INSERT INTO sync_state (source, watermark) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE watermark = VALUES(watermark)
+            """,
+            (table, watermark)
+        )
+        connection.commit()
+
+
+async def run_periodic(sync: QdrantSync, interval: int):
+    """Chạy sync định kỳ trong event loop của FastAPI (phần nặng chạy ở thread riêng)"""
+    while True:
+        try:
+            await asyncio.to_thread(sync.run_once)
+        except Exception as e:
+            logger.error(f"Qdrant sync failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đồng bộ MySQL sang Qdrant")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="Sau khi sync, đối chiếu toàn bộ và xóa point không còn dòng MySQL")
+    args = parser.parse_args()
+
+    config = Config()
+    qdrant = QdrantManager(config)
+    qdrant.initialize_collections()
+    mysql = MySQLManager(config)
+    sync = QdrantSync(config, qdrant, mysql)
+    result = sync.run_once()
+    if args.reconcile:
+        for table, deleted in sync.reconcile().items():
+            print(f"{table}: {deleted} orphan points deleted")
+    for table, counts in result.items():
+        print(f"{table}: {counts['upserted']} upserted, {counts['deleted']} deleted")
+
+
+if __name__ == "__main__":
+    main()
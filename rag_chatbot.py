@@ -1,8 +1,12 @@
 # Hệ thống RAG Local cho Chatbot Xếp Thời Khóa Biểu
 # Tech Stack: Qdrant + multilingual-e5-small + Llama 3.2-1B + LangChain + MySQL
 
+import asyncio
 import logging
-from typing import ClassVar, List, Dict, Optional, Any
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Awaitable, Callable, ClassVar, Iterator, List, Dict, Optional, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import json
@@ -11,15 +15,17 @@ import mysql.connector
 from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
-from langchain.llms import Ollama
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
 import re
+import requests
+import unicodedata
 # from qdrant_client.http import models
 import os
 from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
 from pydantic_settings import BaseSettings
 from qdrant_client.http.models import models as qdrant_models
+from entity_index import EntityIndex
 load_dotenv()
 
 
@@ -34,6 +40,7 @@ class IntentType(Enum):
     METRIC_ANALYSIS = "metric_analysis"
     VIOLATION_REVIEW = "violation_review"
     SCHEDULE_COMPARISON = "schedule_comparison"
+    SCHEDULE_ANALYTICS = "schedule_analytics"
 
 # @dataclass
 # class Config:
@@ -80,16 +87,70 @@ class Config(BaseSettings):
     # Ollama
     ollama_base_url: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     llama_model: str = os.getenv("LLAMA_MODEL", "meta-llama/Llama-3.2-1B")
+    ollama_keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    ollama_timeout: int = int(os.getenv("OLLAMA_TIMEOUT", 120))
+
+    # Giới hạn số token sinh ra cho từng template
+    intent_num_predict: int = int(os.getenv("INTENT_NUM_PREDICT", 64))
+    metric_num_predict: int = int(os.getenv("METRIC_NUM_PREDICT", 384))
+    interpretation_num_predict: int = int(os.getenv("INTERPRETATION_NUM_PREDICT", 256))
 
     # Embedding
     embedding_model: str = os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-small")
 
     # Collections
     metrics_collection: str = os.getenv("METRICS_COLLECTION", "schedule_metrics")
+    # Giá trị metric của từng TKB (đồng bộ từ bảng metrics), tách khỏi định nghĩa metric
+    metric_values_collection: str = os.getenv("METRIC_VALUES_COLLECTION", "schedule_metric_values")
     constraints_collection: str = os.getenv("CONSTRAINTS_COLLECTION", "schedule_constraints")
     examples_collection: str = os.getenv("EXAMPLES_COLLECTION", "schedule_examples")
     docs_collection: str = os.getenv("DOCS_COLLECTION", "schedule_docs")
 
+    # Cache timetable đã render
+    timetable_cache_size: int = int(os.getenv("TIMETABLE_CACHE_SIZE", 256))
+
+    # Analytics
+    analytics_limit: int = int(os.getenv("ANALYTICS_LIMIT", 10))
+    analytics_batch_size: int = int(os.getenv("ANALYTICS_BATCH_SIZE", 500))
+    room_overload_hours: float = float(os.getenv("ROOM_OVERLOAD_HOURS", 40))
+
+    # Đồng bộ Qdrant từ MySQL (interval = 0: không chạy định kỳ trong API)
+    qdrant_sync_interval: int = int(os.getenv("QDRANT_SYNC_INTERVAL", 0))
+    sync_batch_size: int = int(os.getenv("SYNC_BATCH_SIZE", 64))
+    sync_cpu_fraction: float = float(os.getenv("SYNC_CPU_FRACTION", 0.25))
+    # Transaction dài nhất dự kiến (giây): dòng có updated_at trong khoảng này trước lúc
+    # đọc có thể chưa commit, nên được đọc lại ở lần sync sau
+    sync_watermark_lag: int = int(os.getenv("SYNC_WATERMARK_LAG", 60))
+
+    # Khoảng thời gian tối thiểu (giây) giữa hai lần kiểm tra thay đổi của từ điển entity
+    entity_refresh_interval: int = int(os.getenv("ENTITY_REFRESH_INTERVAL", 60))
+
+
+# ============================================================================
+# SHARED MODELS
+# ============================================================================
+
+_embedding_models: Dict[str, SentenceTransformer] = {}
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_model(name: str) -> SentenceTransformer:
+    """Lấy embedding model dùng chung trong process (và các worker fork từ nó)"""
+    with _embedding_lock:
+        if name not in _embedding_models:
+            _embedding_models[name] = SentenceTransformer(name)
+        return _embedding_models[name]
+
+
+def preload_models(config: Config):
+    """Nạp model trong master process trước khi fork worker.
+
+    Trọng số chỉ được đọc nên các worker dùng chung trang nhớ copy-on-write.
+    Không encode ở đây: thread pool của torch khởi tạo trước fork sẽ bị treo trong worker.
+    """
+    model = get_embedding_model(config.embedding_model)
+    model.eval()
+    logger.info(f"Preloaded embedding model {config.embedding_model}")
 
 # ============================================================================
 # VECTOR DATABASE MANAGER
@@ -129,13 +190,14 @@ class Config(BaseSettings):
 class QdrantManager:
     def __init__(self, config: Config):
         self.client = QdrantClient(host=config.qdrant_host, port=config.qdrant_port)
-        self.embedding_model = SentenceTransformer(config.embedding_model)
+        self.embedding_model = get_embedding_model(config.embedding_model)
         self.config = config
 
     def initialize_collections(self):
         """Tạo các collections cần thiết"""
         collections = [
             self.config.metrics_collection,
+            self.config.metric_values_collection,
             self.config.constraints_collection,
             self.config.examples_collection,
             self.config.docs_collection
@@ -199,65 +261,621 @@ class MySQLManager:
     def __init__(self, config: Config):
         self.config = config
         self.connection = None
+        # Connection dùng chung không an toàn khi nhiều thread dùng cùng lúc: chỉ giữ
+        # lock trong lúc chạy query, không giữ qua các lời gọi LLM/Qdrant của request
+        self.lock = threading.RLock()
         
-    def connect(self):
-        """Kết nối MySQL"""
-        self.connection = mysql.connector.connect(
+    def open_connection(self):
+        return mysql.connector.connect(
             host=self.config.mysql_host,
             user=self.config.mysql_user,
             password=self.config.mysql_password,
-            database=self.config.mysql_database
+            database=self.config.mysql_database,
+            # Mỗi SELECT đọc dữ liệu mới nhất, không bị giữ trong snapshot của một
+            # transaction REPEATABLE READ kéo dài trên connection dùng chung
+            autocommit=True
         )
+
+    def connect(self):
+        """Kết nối MySQL"""
+        self.connection = self.open_connection()
         
     def get_schedule(self, schedule_code: str) -> Optional[Dict]:
         """Lấy thông tin TKB từ DB"""
-        cursor = self.connection.cursor(dictionary=True)
-        query = """
-            SELECT s.*, 
-                   GROUP_CONCAT(DISTINCT c.course_name) as courses,
-                   GROUP_CONCAT(DISTINCT r.room_name) as rooms
-            FROM schedules s
-            LEFT JOIN schedule_courses sc ON s.schedule_id = sc.schedule_id
-            LEFT JOIN courses c ON sc.course_id = c.course_id
-            LEFT JOIN schedule_rooms sr ON s.schedule_id = sr.schedule_id
-            LEFT JOIN rooms r ON sr.room_id = r.room_id
-            WHERE s.schedule_code = %s
-            GROUP BY s.schedule_id
-        """
-        cursor.execute(query, (schedule_code,))
-        return cursor.fetchone()
+        with self.lock:
+            cursor = self.connection.cursor(dictionary=True, buffered=True)
+            query = """
+                SELECT s.*, 
+                       GROUP_CONCAT(DISTINCT c.course_name) as courses,
+                       GROUP_CONCAT(DISTINCT r.room_name) as rooms
+                FROM schedules s
+                LEFT JOIN schedule_courses sc ON s.schedule_id = sc.schedule_id
+                LEFT JOIN courses c ON sc.course_id = c.course_id
+                LEFT JOIN schedule_rooms sr ON s.schedule_id = sr.schedule_id
+                LEFT JOIN rooms r ON sr.room_id = r.room_id
+                WHERE s.schedule_code = %s
+                GROUP BY s.schedule_id
+            """
+            cursor.execute(query, (schedule_code,))
+            return cursor.fetchone()
     
     def get_schedules_by_week(self, week: int) -> List[Dict]:
         """Lấy danh sách TKB theo tuần"""
-        cursor = self.connection.cursor(dictionary=True)
-        query = "SELECT * FROM schedules WHERE week = %s"
-        cursor.execute(query, (week,))
-        return cursor.fetchall()
+        with self.lock:
+            cursor = self.connection.cursor(dictionary=True)
+            query = "SELECT * FROM schedules WHERE week = %s"
+            cursor.execute(query, (week,))
+            return cursor.fetchall()
     
     def get_schedule_violations(self, schedule_code: str) -> List[Dict]:
         """Lấy danh sách vi phạm của TKB"""
-        cursor = self.connection.cursor(dictionary=True)
+        with self.lock:
+            cursor = self.connection.cursor(dictionary=True)
+            query = """
+                SELECT v.*, c.constraint_name, c.severity
+                FROM violations v
+                JOIN constraints c ON v.constraint_id = c.constraint_id
+                WHERE v.schedule_code = %s
+                ORDER BY c.severity DESC
+            """
+            cursor.execute(query, (schedule_code,))
+            return cursor.fetchall()
+
+    def get_schedule_version(self, schedule_code: str) -> Optional[Dict]:
+        """Lấy schedule_id và version của TKB (dùng để kiểm tra cache)"""
+        with self.lock:
+            cursor = self.connection.cursor(dictionary=True, buffered=True)
+            # TKB chưa từng thay đổi sau khi tạo chưa có dòng trong schedule_versions
+            query = """
+                SELECT s.schedule_id, COALESCE(sv.version, 0) AS version
+                FROM schedules s
+                LEFT JOIN schedule_versions sv ON sv.schedule_id = s.schedule_id
+                WHERE s.schedule_code = %s
+            """
+            cursor.execute(query, (schedule_code,))
+            return cursor.fetchone()
+
+    def get_schedule_timetable(self, schedule_id: int) -> List[Dict]:
+        """Lấy các buổi học của TKB, sắp theo ngày và giờ bắt đầu"""
+        with self.lock:
+            cursor = self.connection.cursor(dictionary=True)
+            # ORDER BY trùng thứ tự idx_schedule_course_lookup nên không cần filesort
+            query = """
+                SELECT sc.day_of_week, sc.start_time, sc.end_time,
+                       c.course_code, c.course_name,
+                       t.teacher_name, r.room_code
+                FROM schedule_courses sc FORCE INDEX (idx_schedule_course_lookup)
+                JOIN courses c ON sc.course_id = c.course_id
+                LEFT JOIN teachers t ON sc.teacher_id = t.teacher_id
+                LEFT JOIN rooms r ON sc.room_id = r.room_id
+                WHERE sc.schedule_id = %s
+                ORDER BY sc.day_of_week, sc.start_time
+            """
+            cursor.execute(query, (schedule_id,))
+            return cursor.fetchall()
+
+    def stream(self, query: str, params: tuple = (), batch_size: int = 500) -> Iterator[Dict]:
+        """Đọc kết quả theo batch bằng cursor unbuffered, không nạp cả bảng vào Python.
+
+        Dùng connection riêng để stream chưa đọc xong không chặn các query khác.
+        """
+        connection = self.open_connection()
+        try:
+            cursor = connection.cursor(dictionary=True, buffered=False)
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _week_filter(week_from: Optional[int],
+                     week_to: Optional[int]) -> Tuple[str, tuple, str, tuple]:
+        """Điều kiện lọc TKB active theo tuần và biểu thức số tuần làm mẫu số giờ/tuần"""
+        if week_from is None:
+            # Không chỉ định tuần: mọi tuần có TKB active (học kỳ hiện tại)
+            return (
+                "s.status = 'active'", (),
+                "(SELECT GREATEST(COUNT(DISTINCT week), 1) FROM schedules WHERE status = 'active')", ()
+            )
+        # Tuần không có buổi nào vẫn tính vào mẫu số
+        return (
+            "s.status = 'active' AND s.week BETWEEN %s AND %s", (week_from, week_to),
+            "%s", (week_to - week_from + 1,)
+        )
+
+    def stream_room_load(self, week_from: Optional[int], week_to: Optional[int],
+                         limit: int, ascending: bool = False,
+                         batch_size: int = 500) -> Iterator[Dict]:
+        """Số buổi và số giờ/tuần của từng phòng trong khoảng tuần"""
+        where, params, weeks, weeks_params = self._week_filter(week_from, week_to)
+        query = f"""
+            SELECT r.room_code, r.room_name, r.capacity,
+                   COUNT(*) AS total_sessions,
+                   SUM(TIME_TO_SEC(TIMEDIFF(sc.end_time, sc.start_time))) / 3600 AS total_hours,
+                   SUM(TIME_TO_SEC(TIMEDIFF(sc.end_time, sc.start_time))) / 3600
+                       / {weeks} AS hours_per_week
+            FROM schedules s
+            JOIN schedule_courses sc ON sc.schedule_id = s.schedule_id
+            JOIN rooms r ON r.room_id = sc.room_id
+            WHERE {where}
+            GROUP BY r.room_id
+            ORDER BY hours_per_week {"ASC" if ascending else "DESC"}
+            LIMIT %s
+        """
+        return self.stream(query, weeks_params + params + (limit,), batch_size)
+
+    def stream_teacher_load(self, week_from: Optional[int], week_to: Optional[int],
+                            limit: int, ascending: bool = False,
+                            batch_size: int = 500) -> Iterator[Dict]:
+        """Số buổi và số giờ/tuần của từng giảng viên trong khoảng tuần"""
+        where, params, weeks, weeks_params = self._week_filter(week_from, week_to)
+        query = f"""
+            SELECT t.teacher_code, t.teacher_name, t.max_hours_per_week,
+                   COUNT(*) AS total_sessions,
+                   SUM(TIME_TO_SEC(TIMEDIFF(sc.end_time, sc.start_time))) / 3600 AS total_hours,
+                   SUM(TIME_TO_SEC(TIMEDIFF(sc.end_time, sc.start_time))) / 3600
+                       / {weeks} AS hours_per_week
+            FROM schedules s
+            JOIN schedule_courses sc ON sc.schedule_id = s.schedule_id
+            JOIN teachers t ON t.teacher_id = sc.teacher_id
+            WHERE {where}
+            GROUP BY t.teacher_id
+            ORDER BY hours_per_week {"ASC" if ascending else "DESC"}
+            LIMIT %s
+        """
+        return self.stream(query, weeks_params + params + (limit,), batch_size)
+
+    def stream_weekly_summary(self, week_from: Optional[int], week_to: Optional[int],
+                              batch_size: int = 500) -> Iterator[Dict]:
+        """Tổng hợp số TKB, môn học, vi phạm và điểm trung bình theo tuần"""
+        where, params, _, _ = self._week_filter(week_from, week_to)
+        # Đếm môn học và vi phạm bằng subquery riêng cho từng TKB: join
+        # schedule_courses x violations sẽ nhân số vi phạm lên theo số buổi học
+        query = f"""
+            SELECT week,
+                   COUNT(*) AS total_schedules,
+                   SUM(total_courses) AS total_courses,
+                   SUM(total_violations) AS total_violations,
+                   AVG(quality_score) AS avg_quality_score
+            FROM (
+                SELECT s.week, s.quality_score,
+                       (SELECT COUNT(DISTINCT sc.course_id) FROM schedule_courses sc
+                        WHERE sc.schedule_id = s.schedule_id) AS total_courses,
+                       (SELECT COUNT(*) FROM violations v
+                        WHERE v.schedule_code = s.schedule_code) AS total_violations
+                FROM schedules s
+                WHERE {where}
+            ) per_schedule
+            GROUP BY week
+            ORDER BY week
+        """
+        return self.stream(query, params, batch_size)
+
+    def stream_entity_version(self) -> Iterator[Dict]:
+        """Số dòng và thời điểm thay đổi gần nhất của các bảng nguồn entity"""
+        query = """
+            SELECT 'schedules' AS source, COUNT(*) AS total, MAX(updated_at) AS changed FROM schedules
+            UNION ALL SELECT 'courses', COUNT(*), MAX(updated_at) FROM courses
+            UNION ALL SELECT 'rooms', COUNT(*), MAX(updated_at) FROM rooms
+            UNION ALL SELECT 'teachers', COUNT(*), MAX(updated_at) FROM teachers
+        """
+        return self.stream(query)
+
+    def stream_entities(self, batch_size: int = 500) -> Iterator[Dict]:
+        """Mã và tên của mọi TKB, môn học, phòng, giảng viên"""
         query = """
-            SELECT v.*, c.constraint_name, c.severity
-            FROM violations v
-            JOIN constraints c ON v.constraint_id = c.constraint_id
-            WHERE v.schedule_code = %s
-            ORDER BY c.severity DESC
+            SELECT 'schedule' AS kind, schedule_code AS code, schedule_name AS name FROM schedules
+            UNION ALL SELECT 'course', course_code, course_name FROM courses
+            UNION ALL SELECT 'room', room_code, room_name FROM rooms
+            UNION ALL SELECT 'teacher', teacher_code, teacher_name FROM teachers
         """
-        cursor.execute(query, (schedule_code,))
-        return cursor.fetchall()
+        return self.stream(query, (), batch_size)
 
 # ============================================================================
-# INTENT DETECTION
+# ANALYTICS
 # ============================================================================
 
-class IntentDetector:
-    def __init__(self, llm):
-        self.llm = llm
-        self.intent_prompt = PromptTemplate(
-            input_variables=["query"],
-            template="""Phân tích câu hỏi sau và xác định intent:
-Query: {query}
+class ScheduleAnalytics:
+    """Trả lời câu hỏi tổng hợp theo tuần, phòng và giảng viên.
+
+    Việc gom nhóm nằm hoàn toàn trong SQL; Python chỉ đọc stream các dòng kết quả đã tổng hợp.
+    """
+
+    def __init__(self, mysql: MySQLManager, config: Config):
+        self.mysql = mysql
+        self.config = config
+
+    @staticmethod
+    def parse_week_range(query: str, entities: Dict) -> Tuple[Optional[int], Optional[int]]:
+        """Tách khoảng tuần: "tuần 1-4", "tuần 1 đến 4" hoặc một tuần đơn"""
+        range_match = re.search(r'tuần\s+(\d+)\s*(?:-|–|đến|tới)\s*(?:tuần\s+)?(\d+)', query.lower())
+        if range_match:
+            start, end = int(range_match.group(1)), int(range_match.group(2))
+            return min(start, end), max(start, end)
+        if entities.get("week") is not None:
+            return entities["week"], entities["week"]
+        return None, None
+
+    def answer(self, query: str, entities: Dict) -> str:
+        week_from, week_to = self.parse_week_range(query, entities)
+        lowered = query.lower()
+        ascending = any(kw in lowered for kw in ["ít nhất", "thấp nhất", "trống"])
+
+        if any(kw in lowered for kw in ["giảng viên", "giáo viên"]):
+            return self.teacher_load(week_from, week_to, ascending)
+        if "phòng" in lowered:
+            return self.room_load(week_from, week_to, ascending)
+        return self.weekly_summary(week_from, week_to)
+
+    @staticmethod
+    def _scope(week_from: Optional[int], week_to: Optional[int]) -> str:
+        if week_from is None:
+            return "các TKB đang áp dụng"
+        if week_from == week_to:
+            return f"tuần {week_from} (TKB đang áp dụng)"
+        return f"tuần {week_from}-{week_to} (TKB đang áp dụng)"
+
+    def room_load(self, week_from: Optional[int], week_to: Optional[int],
+                  ascending: bool = False) -> str:
+        rows = self.mysql.stream_room_load(
+            week_from, week_to, self.config.analytics_limit, ascending,
+            self.config.analytics_batch_size
+        )
+        lines = [
+            f"🏫 **Mức sử dụng phòng ({self._scope(week_from, week_to)}):**",
+            "",
+            "| Phòng | Sức chứa | Số buổi | Giờ/tuần |",
+            "|---|---|---|---|",
+        ]
+        for r in rows:
+            hours = float(r["hours_per_week"] or 0)
+            flag = " ⚠️" if hours > self.config.room_overload_hours else ""
+            lines.append(
+                f"| {r['room_code']} | {r['capacity']} | {r['total_sessions']} | {hours:.1f}{flag} |"
+            )
+        if len(lines) == 4:
+            return f"Không có dữ liệu sử dụng phòng cho {self._scope(week_from, week_to)}"
+        lines.append("")
+        lines.append(f"⚠️: vượt {self.config.room_overload_hours:g} giờ/tuần")
+        return "\n".join(lines)
+
+    def teacher_load(self, week_from: Optional[int], week_to: Optional[int],
+                     ascending: bool = False) -> str:
+        rows = self.mysql.stream_teacher_load(
+            week_from, week_to, self.config.analytics_limit, ascending,
+            self.config.analytics_batch_size
+        )
+        lines = [
+            f"👩‍🏫 **Khối lượng giảng dạy ({self._scope(week_from, week_to)}):**",
+            "",
+            "| Giảng viên | Số buổi | Giờ/tuần | Tối đa |",
+            "|---|---|---|---|",
+        ]
+        for r in rows:
+            hours = float(r["hours_per_week"] or 0)
+            max_hours = r["max_hours_per_week"]
+            flag = " ⚠️" if max_hours is not None and hours > max_hours else ""
+            lines.append(
+                f"| {r['teacher_name']} ({r['teacher_code']}) | {r['total_sessions']} "
+                f"| {hours:.1f}{flag} | {max_hours if max_hours is not None else 'N/A'} |"
+            )
+        if len(lines) == 4:
+            return f"Không có dữ liệu giảng dạy cho {self._scope(week_from, week_to)}"
+        return "\n".join(lines)
+
+    def weekly_summary(self, week_from: Optional[int], week_to: Optional[int]) -> str:
+        rows = self.mysql.stream_weekly_summary(
+            week_from, week_to, self.config.analytics_batch_size
+        )
+        scope = "tất cả các tuần" if week_from is None else self._scope(week_from, week_to)
+        lines = [
+            f"📊 **Tổng hợp theo tuần ({scope}):**",
+            "",
+            "| Tuần | Số TKB | Số môn | Vi phạm | Điểm TB |",
+            "|---|---|---|---|---|",
+        ]
+        for r in rows:
+            score = r["avg_quality_score"]
+            lines.append(
+                f"| {r['week']} | {r['total_schedules']} | {r['total_courses']} "
+                f"| {r['total_violations']} | {f'{float(score):.1f}' if score is not None else 'N/A'} |"
+            )
+        if len(lines) == 4:
+            return f"Không có dữ liệu TKB cho {scope}"
+        return "\n".join(lines)
+
+# ============================================================================
+# TIMETABLE RENDERER
+# ============================================================================
+
+DAY_LABELS = {
+    "Monday": "Thứ 2",
+    "Tuesday": "Thứ 3",
+    "Wednesday": "Thứ 4",
+    "Thursday": "Thứ 5",
+    "Friday": "Thứ 6",
+    "Saturday": "Thứ 7",
+    "Sunday": "CN",
+}
+
+
+def _format_time(value: Any) -> str:
+    # mysql-connector trả cột TIME dưới dạng timedelta
+    if isinstance(value, timedelta):
+        minutes = int(value.total_seconds()) // 60
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+    return str(value)[:5] if value is not None else "?"
+
+
+class TimetableRenderer:
+    """Render lưới ngày × tiết của TKB ra Markdown và JSON, cache theo (schedule, version)"""
+
+    def __init__(self, mysql: MySQLManager, max_size: int = 256):
+        self.mysql = mysql
+        self.max_size = max_size
+        self._cache: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, schedule_code: str) -> Optional[Dict[str, Any]]:
+        """Trả về {"markdown": ..., "json": ...} hoặc None nếu không có TKB"""
+        version = self.mysql.get_schedule_version(schedule_code)
+        if not version:
+            return None
+
+        schedule_id = version["schedule_id"]
+        render_version = version["version"]
+        with self._lock:
+            cached = self._cache.get(schedule_id)
+            if cached and cached[0] == render_version:
+                self._cache.move_to_end(schedule_id)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        schedule = self.mysql.get_schedule(schedule_code)
+        sessions = self.mysql.get_schedule_timetable(schedule_id)
+        rendered = self.render(schedule, sessions)
+
+        with self._lock:
+            self._cache[schedule_id] = (render_version, rendered)
+            self._cache.move_to_end(schedule_id)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return rendered
+
+    @staticmethod
+    def build_grid(sessions: List[Dict]) -> Dict[str, Any]:
+        """Dựng lưới gọn: chỉ giữ các ngày và khung giờ có buổi học"""
+        days = [d for d in DAY_LABELS if any(s["day_of_week"] == d for s in sessions)]
+        slots = sorted({
+            (_format_time(s["start_time"]), _format_time(s["end_time"])) for s in sessions
+        })
+        day_index = {d: i for i, d in enumerate(days)}
+        slot_index = {slot: i for i, slot in enumerate(slots)}
+
+        grid: List[List[List[Dict]]] = [[[] for _ in days] for _ in slots]
+        for s in sessions:
+            slot = (_format_time(s["start_time"]), _format_time(s["end_time"]))
+            grid[slot_index[slot]][day_index[s["day_of_week"]]].append({
+                "course_code": s["course_code"],
+                "course_name": s["course_name"],
+                "teacher": s.get("teacher_name"),
+                "room": s.get("room_code"),
+            })
+
+        return {
+            "days": days,
+            "slots": [f"{start}-{end}" for start, end in slots],
+            "grid": grid,
+        }
+
+    @classmethod
+    def render(cls, schedule: Dict, sessions: List[Dict]) -> Dict[str, Any]:
+        timetable = cls.build_grid(sessions)
+        data = {
+            "schedule_code": schedule["schedule_code"],
+            "week": schedule.get("week"),
+            "status": schedule.get("status"),
+            **timetable,
+        }
+
+        lines = [
+            f"📅 **Thời Khóa Biểu: {schedule['schedule_code']}**",
+            "",
+            f"- Tuần: {schedule.get('week', 'N/A')}",
+            f"- Môn học: {schedule.get('courses', 'N/A')}",
+            f"- Phòng học: {schedule.get('rooms', 'N/A')}",
+            f"- Trạng thái: {schedule.get('status', 'N/A')}",
+            "",
+        ]
+        if not sessions:
+            lines.append("Chưa có buổi học nào được xếp.")
+        else:
+            lines.append("| Giờ | " + " | ".join(DAY_LABELS[d] for d in timetable["days"]) + " |")
+            lines.append("|---" * (len(timetable["days"]) + 1) + "|")
+            for slot, row in zip(timetable["slots"], timetable["grid"]):
+                cells = [
+                    "<br>".join(
+                        " · ".join(filter(None, [c["course_code"], c["room"], c["teacher"]]))
+                        for c in cell
+                    )
+                    for cell in row
+                ]
+                lines.append(f"| {slot} | " + " | ".join(cells) + " |")
+
+        return {"markdown": "\n".join(lines), "json": data}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+# ============================================================================
+# PROMPT REGISTRY
+# ============================================================================
+
+class IntentEntities(BaseModel):
+    schedule_code: Optional[str] = None
+    week: Optional[int] = None
+    constraints: List[str] = []
+
+
+class IntentResult(BaseModel):
+    """Schema output của intent prompt, dùng làm format cho Ollama"""
+    intent: IntentType
+    entities: IntentEntities = IntentEntities()
+
+
+@dataclass
+class PromptSpec:
+    """Định nghĩa một template: phần system tĩnh + phần prompt thay đổi theo request"""
+    name: str
+    system: str
+    template: str
+    input_variables: List[str]
+    num_predict: int
+    # "json" hoặc JSON schema để Ollama ràng buộc output theo grammar
+    format: Optional[Any] = None
+    temperature: Optional[float] = None
+
+
+class PromptStats:
+    """Thống kê TTFT và tokens/sec của một template.
+
+    cold lấy từ lần warmup: model chưa nạp (với template đầu tiên) và phần system
+    chưa có trong KV cache, nên đây là mốc TTFT và số token prompt khi không tái sử dụng
+    prefix. warm là trung bình các lần gọi thật. prompt_tokens là số token prompt Ollama
+    phải đánh giá lại: phần prefix lấy từ KV cache không được tính. Warmup chỉ sinh
+    1 token nên tokens/sec chỉ đo trên các lần gọi thật (tái sử dụng prefix không đổi tốc độ sinh).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cold: Optional[Dict[str, float]] = None
+        self.warm_ttft_ms = 0.0
+        self.warm_tokens_per_sec = 0.0
+        self.warm_prompt_tokens = 0
+
+    @staticmethod
+    def _measure(data: Dict) -> Dict[str, float]:
+        # Ollama trả về thời gian theo nanosecond
+        load_ns = data.get("load_duration", 0)
+        prompt_ns = data.get("prompt_eval_duration", 0)
+        eval_ns = data.get("eval_duration", 0)
+        eval_count = data.get("eval_count", 0)
+        return {
+            "load_ms": load_ns / 1e6,
+            "ttft_ms": (load_ns + prompt_ns) / 1e6,
+            "tokens_per_sec": eval_count / (eval_ns / 1e9) if eval_ns else 0.0,
+            "prompt_tokens": data.get("prompt_eval_count", 0),
+        }
+
+    def record_cold(self, data: Dict):
+        sample = self._measure(data)
+        with self._lock:
+            self.cold = {
+                "load_ms": sample["load_ms"],
+                "ttft_ms": sample["ttft_ms"],
+                "prompt_tokens": sample["prompt_tokens"],
+            }
+
+    def record(self, data: Dict):
+        sample = self._measure(data)
+        with self._lock:
+            self.calls += 1
+            self.warm_ttft_ms += sample["ttft_ms"]
+            self.warm_tokens_per_sec += sample["tokens_per_sec"]
+            self.warm_prompt_tokens += sample["prompt_tokens"]
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            warm = None
+            if self.calls:
+                warm = {
+                    "ttft_ms": self.warm_ttft_ms / self.calls,
+                    "tokens_per_sec": self.warm_tokens_per_sec / self.calls,
+                    "prompt_tokens": self.warm_prompt_tokens / self.calls,
+                }
+            report = {"calls": self.calls, "cold": self.cold, "warm": warm}
+            if self.cold and warm:
+                report["ttft_gain_ms"] = self.cold["ttft_ms"] - warm["ttft_ms"]
+                report["prompt_tokens_saved"] = self.cold["prompt_tokens"] - warm["prompt_tokens"]
+            return report
+
+
+class PromptChain:
+    """Chain đã biên dịch sẵn, gọi thẳng Ollama /api/generate.
+
+    Phần system tĩnh luôn đứng đầu và giống hệt nhau giữa các lần gọi nên
+    Ollama tái sử dụng được prefix trong KV cache; keep_alive giữ model trong RAM.
+    """
+
+    def __init__(self, spec: PromptSpec, config: Config, session: requests.Session):
+        self.spec = spec
+        self.prompt = PromptTemplate(
+            input_variables=spec.input_variables,
+            template=spec.template
+        )
+        self.session = session
+        self.url = f"{config.ollama_base_url}/api/generate"
+        self.timeout = config.ollama_timeout
+        self.options = {"num_predict": spec.num_predict}
+        if spec.temperature is not None:
+            self.options["temperature"] = spec.temperature
+        self.payload = {
+            "model": config.llama_model,
+            "system": spec.system,
+            "stream": False,
+            "keep_alive": config.ollama_keep_alive,
+            "options": self.options,
+        }
+        if spec.format is not None:
+            self.payload["format"] = spec.format
+        self.stats = PromptStats()
+
+    def _generate(self, prompt: str, num_predict: Optional[int] = None,
+                  record: bool = True) -> Dict:
+        payload = dict(self.payload, prompt=prompt)
+        if num_predict is not None:
+            payload["options"] = dict(self.options, num_predict=num_predict)
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if record:
+            self.stats.record(data)
+        return data
+
+    def run(self, **kwargs) -> str:
+        return self._generate(self.prompt.format(**kwargs)).get("response", "")
+
+    def warmup(self):
+        """Nạp model và đưa phần system tĩnh vào KV cache, ghi lại làm mốc cold"""
+        # Prompt rỗng chỉ nạp model, cần một prompt ngắn để system được đánh giá
+        self.stats.record_cold(self._generate(".", num_predict=1, record=False))
+
+
+class PromptRegistry:
+    """Tập các chain được dựng một lần khi khởi động"""
+
+    def __init__(self, config: Config):
+        self.session = requests.Session()
+        self.chains: Dict[str, PromptChain] = {
+            spec.name: PromptChain(spec, config, self.session)
+            for spec in self._specs(config)
+        }
+
+    @staticmethod
+    def _specs(config: Config) -> List[PromptSpec]:
+        return [
+            PromptSpec(
+                name="intent",
+                system="""Phân tích câu hỏi của người dùng và xác định intent.
 
 Các intent có thể:
 1. input_interpretation - Hiểu yêu cầu, trích xuất thông tin
@@ -265,25 +883,130 @@ Các intent có thể:
 3. metric_analysis - Phân tích chất lượng TKB
 4. violation_review - Kiểm tra vi phạm
 5. schedule_comparison - So sánh nhiều TKB
+6. schedule_analytics - Thống kê tổng hợp theo tuần, phòng, giảng viên
+
+Chỉ trả về JSON gồm intent và entities (schedule_code, week, constraints), bỏ trống entity không có trong câu hỏi.""",
+                template="Query: {query}",
+                input_variables=["query"],
+                num_predict=config.intent_num_predict,
+                format=IntentResult.model_json_schema(),
+                temperature=0.0
+            ),
+            PromptSpec(
+                name="metric_analysis",
+                system="""Bạn là trợ lý đánh giá thời khóa biểu (TKB).
+Dựa trên các metric và thông tin TKB được cung cấp, hãy phân tích và đánh giá chất lượng TKB. Trả lời ngắn gọn, rõ ràng.""",
+                template="""Dựa trên các metric sau:
+{context}
+
+Thông tin TKB: {schedule}
+
+Câu hỏi: {query}""",
+                input_variables=["context", "query", "schedule"],
+                num_predict=config.metric_num_predict
+            ),
+            PromptSpec(
+                name="input_interpretation",
+                system="""Bạn là trợ lý xếp thời khóa biểu.
+Dựa trên các ví dụ được cung cấp, hãy giải thích người dùng muốn làm gì và gợi ý cách hỏi rõ hơn.""",
+                template="""Dựa trên các ví dụ:
+{context}
+
+Câu hỏi của người dùng: {query}""",
+                input_variables=["context", "query"],
+                num_predict=config.interpretation_num_predict
+            ),
+        ]
+
+    def get(self, name: str) -> PromptChain:
+        return self.chains[name]
+
+    def warmup(self):
+        """Gọi warmup cho từng template, lỗi chỉ ghi log để không chặn khởi động"""
+        for name, chain in self.chains.items():
+            try:
+                chain.warmup()
+            except requests.RequestException as e:
+                logger.warning(f"Warmup prompt '{name}' failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: chain.stats.report() for name, chain in self.chains.items()}
+
+# ============================================================================
+# INTENT DETECTION
+# ============================================================================
+
+class IntentStats:
+    """Đếm số lần intent detection thành công / thất bại"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"ok": 0, "parse_failure": 0, "request_error": 0}
+
+    def record(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.counts.values())
+            failures = total - self.counts["ok"]
+            return {
+                "calls": total,
+                **self.counts,
+                "failure_rate": failures / total if total else 0.0,
+            }
+
+
+class IntentDetector:
+    def __init__(self, prompts: PromptRegistry, entity_index: Optional[EntityIndex] = None):
+        self.chain = prompts.get("intent")
+        self.entity_index = entity_index
+        self.stats = IntentStats()
 
-Trả về JSON format:
-{{"intent": "...", "entities": {{"schedule_code": "...", "week": ..., "constraints": []}}}}"""
-        )
-        
     def detect(self, query: str) -> Dict:
         """Phát hiện intent và trích xuất entities"""
-        chain = LLMChain(llm=self.llm, prompt=self.intent_prompt)
-        result = chain.run(query=query)
-        
+        result = self._detect_with_llm(query)
+        if self.entity_index is not None:
+            self._resolve_entities(query, result["entities"])
+        return result
+
+    def _resolve_entities(self, query: str, entities: Dict):
+        """Thay entity do LLM/regex đoán bằng entity có thật trong dữ liệu"""
+        resolved = self.entity_index.resolve(query)
+        # Chỉ khớp chính xác mới được thay mã TKB; khớp gần đúng chỉ là gợi ý
+        schedule_codes = [e["code"] for e in resolved["schedule"] if e["score"] == 1.0]
+        if schedule_codes:
+            entities["schedule_code"] = schedule_codes[0]
+            entities["schedule_codes"] = schedule_codes
+        candidates = [e["code"] for e in resolved["schedule"] if e["score"] < 1.0]
+        if candidates:
+            entities["schedule_candidates"] = candidates
+        for kind in ("course", "room", "teacher"):
+            codes = [e["code"] for e in resolved[kind]]
+            if codes:
+                entities[f"{kind}_codes"] = codes
+
+    def _detect_with_llm(self, query: str) -> Dict:
         try:
-            # Parse JSON response
-            json_match = re.search(r'\{.*\}', result, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-        except:
-            pass
-            
-        # Fallback: Simple pattern matching
+            raw = self.chain.run(query=query)
+        except requests.RequestException as e:
+            logger.warning(f"Intent request failed: {e}")
+            self.stats.record("request_error")
+            return self._detect_by_rules(query)
+
+        try:
+            result = IntentResult.model_validate_json(raw)
+        except ValidationError as e:
+            logger.warning(f"Intent output does not match schema: {e.error_count()} errors")
+            self.stats.record("parse_failure")
+            return self._detect_by_rules(query)
+
+        self.stats.record("ok")
+        return result.model_dump(mode="json", exclude_none=True)
+
+    def _detect_by_rules(self, query: str) -> Dict:
+        """Fallback: Simple pattern matching"""
         entities = {}
         
         # Extract schedule code (format: ABC123, CLB102, etc)
@@ -299,7 +1022,9 @@ Trả về JSON format:
         # Determine intent
         intent = IntentType.INPUT_INTERPRETATION.value
         
-        if any(kw in query.lower() for kw in ["hiển thị", "xem", "lấy", "cho mình"]):
+        if any(kw in query.lower() for kw in ["quá tải", "nhiều nhất", "ít nhất", "thống kê", "tổng hợp"]):
+            intent = IntentType.SCHEDULE_ANALYTICS.value
+        elif any(kw in query.lower() for kw in ["hiển thị", "xem", "lấy", "cho mình"]):
             intent = IntentType.SCHEDULE_RETRIEVAL.value
         elif any(kw in query.lower() for kw in ["chất lượng", "điểm", "cân bằng", "đánh giá"]):
             intent = IntentType.METRIC_ANALYSIS.value
@@ -310,6 +1035,52 @@ Trả về JSON format:
         
         return {"intent": intent, "entities": entities}
 
+# ============================================================================
+# REQUEST COALESCING
+# ============================================================================
+
+def normalize_query(query: str) -> str:
+    """Key để gộp câu hỏi: chuẩn NFC, chữ thường, gộp khoảng trắng, bỏ dấu câu cuối"""
+    text = unicodedata.normalize("NFC", query).lower()
+    return " ".join(text.split()).rstrip(" ?!.")
+
+
+class SingleFlight:
+    """Gộp các lời gọi cùng key đang chạy đồng thời thành một lần tính, dùng chung kết quả.
+
+    Chạy trong event loop: chỉ lời gọi đầu tiên tạo task, các lời gọi sau chờ trên
+    chính task đó nên không chiếm thêm thread nào trong threadpool.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.computations = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.computations += 1
+        else:
+            self.coalesced += 1
+        # shield: một client ngắt kết nối không hủy lần tính mà các client khác đang chờ
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.computations + self.coalesced,
+            "computations": self.computations,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
+
 # ============================================================================
 # RAG CHATBOT
 # ============================================================================
@@ -317,13 +1088,14 @@ Trả về JSON format:
 class ScheduleRAGChatbot:
     def __init__(self, config: Config):
         self.config = config
+        self.inflight = SingleFlight()
         self.qdrant = QdrantManager(config)
         self.mysql = MySQLManager(config)
-        self.llm = Ollama(
-            model=config.llama_model,
-            base_url=config.ollama_base_url
-        )
-        self.intent_detector = IntentDetector(self.llm)
+        self.timetables = TimetableRenderer(self.mysql, config.timetable_cache_size)
+        self.analytics = ScheduleAnalytics(self.mysql, config)
+        self.entities = EntityIndex(self.mysql, config.entity_refresh_interval)
+        self.prompts = PromptRegistry(config)
+        self.intent_detector = IntentDetector(self.prompts, self.entities)
         
     def initialize(self):
         """Khởi tạo hệ thống"""
@@ -333,11 +1105,35 @@ class ScheduleRAGChatbot:
         logger.info("Sql connect prepare.")
         self.mysql.connect()
         logger.info("MySQL connected.")
+        self.entities.maybe_refresh()
+        logger.info("Warming up prompt chains...")
+        self.prompts.warmup()
+        logger.info("Prompt chains ready.")
         
-    def process_query(self, query: str) -> str:
-        """Xử lý câu hỏi từ người dùng"""
-        # 1. Detect intent
+    async def answer(self, query: str) -> Dict[str, Any]:
+        """Trả lời câu hỏi, trả về {"intent_result", "response"}.
+
+        Các câu hỏi giống nhau (sau chuẩn hóa) đến khi một câu đang được xử lý
+        sẽ chờ và dùng chung kết quả thay vì gọi lại LLM, Qdrant và MySQL.
+        Chỉ lần xử lý đầu tiên chạy trong thread riêng.
+        """
+        return await self.inflight.do(
+            normalize_query(query), lambda: asyncio.to_thread(self._answer, query)
+        )
+
+    def _answer(self, query: str) -> Dict[str, Any]:
         intent_result = self.intent_detector.detect(query)
+        response = self.process_query(query, intent_result)
+        return {"intent_result": intent_result, "response": response}
+
+    def get_timetable(self, schedule_code: str) -> Optional[Dict[str, Any]]:
+        return self.timetables.get(schedule_code)
+
+    def process_query(self, query: str, intent_result: Optional[Dict] = None) -> str:
+        """Xử lý câu hỏi từ người dùng"""
+        # 1. Detect intent (bỏ qua nếu caller đã detect sẵn)
+        if intent_result is None:
+            intent_result = self.intent_detector.detect(query)
         intent = intent_result["intent"]
         entities = intent_result["entities"]
         
@@ -350,6 +1146,8 @@ class ScheduleRAGChatbot:
             return self._handle_violation_review(entities, query)
         elif intent == IntentType.SCHEDULE_COMPARISON.value:
             return self._handle_schedule_comparison(entities, query)
+        elif intent == IntentType.SCHEDULE_ANALYTICS.value:
+            return self._handle_schedule_analytics(entities, query)
         else:
             return self._handle_input_interpretation(query)
     
@@ -360,22 +1158,13 @@ class ScheduleRAGChatbot:
         if not schedule_code:
             return "Vui lòng cung cấp mã thời khóa biểu (ví dụ: CLB101, ABC123)"
         
-        # Query MySQL
-        schedule = self.mysql.get_schedule(schedule_code)
+        # Lấy timetable đã render (cache theo version)
+        timetable = self.timetables.get(schedule_code)
         
-        if not schedule:
+        if not timetable:
             return f"Không tìm thấy thời khóa biểu với mã {schedule_code}"
         
-        # Format response
-        response = f"""
-📅 **Thời Khóa Biểu: {schedule_code}**
-
-- Tuần: {schedule.get('week', 'N/A')}
-- Môn học: {schedule.get('courses', 'N/A')}
-- Phòng học: {schedule.get('rooms', 'N/A')}
-- Trạng thái: {schedule.get('status', 'N/A')}
-"""
-        return response.strip()
+        return timetable["markdown"]
     
     def _handle_metric_analysis(self, entities: Dict, query: str) -> str:
         """Xử lý intent: Phân tích metric"""
@@ -399,20 +1188,7 @@ class ScheduleRAGChatbot:
             context += f"- {doc['payload'].get('text', '')}\n"
         
         # Generate analysis with LLM
-        prompt = PromptTemplate(
-            input_variables=["context", "query", "schedule"],
-            template="""Dựa trên các metric sau:
-{context}
-
-Thông tin TKB: {schedule}
-
-Câu hỏi: {query}
-
-Hãy phân tích và đánh giá chất lượng TKB. Trả lời ngắn gọn, rõ ràng."""
-        )
-        
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        result = chain.run(
+        result = self.prompts.get("metric_analysis").run(
             context=context,
             query=query,
             schedule=json.dumps(schedule, ensure_ascii=False) if schedule else "Chưa có thông tin"
@@ -446,8 +1222,8 @@ Hãy phân tích và đánh giá chất lượng TKB. Trả lời ngắn gọn,
     
     def _handle_schedule_comparison(self, entities: Dict, query: str) -> str:
         """Xử lý intent: So sánh TKB"""
-        # Extract multiple schedule codes
-        codes = re.findall(r'\b([A-Z]{2,3}\d{2,3})\b', query)
+        # Mã TKB đã được entity index nhận diện; regex chỉ dùng khi chưa nạp được từ điển
+        codes = entities.get("schedule_codes") or re.findall(r'\b([A-Z]{2,3}\d{2,3})\b', query)
         
         if len(codes) < 2:
             return "Vui lòng cung cấp ít nhất 2 mã TKB để so sánh (ví dụ: CLB101 và CLB102)"
@@ -471,6 +1247,10 @@ Hãy phân tích và đánh giá chất lượng TKB. Trả lời ngắn gọn,
         
         return response
     
+    def _handle_schedule_analytics(self, entities: Dict, query: str) -> str:
+        """Xử lý intent: Thống kê tổng hợp theo tuần, phòng, giảng viên"""
+        return self.analytics.answer(query, entities)
+    
     def _handle_input_interpretation(self, query: str) -> str:
         """Xử lý intent: Hiểu và giải thích yêu cầu"""
         # Search examples
@@ -484,18 +1264,7 @@ Hãy phân tích và đánh giá chất lượng TKB. Trả lời ngắn gọn,
         for ex in examples:
             context += f"- {ex['payload'].get('text', '')}\n"
         
-        prompt = PromptTemplate(
-            input_variables=["context", "query"],
-            template="""Dựa trên các ví dụ:
-{context}
-
-Câu hỏi của người dùng: {query}
-
-Hãy giải thích người dùng muốn làm gì và gợi ý cách hỏi rõ hơn."""
-        )
-        
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.run(context=context, query=query)
+        return self.prompts.get("input_interpretation").run(context=context, query=query)
 
 # ============================================================================
 # MAIN - USAGE EXAMPLE
@@ -0,0 +1,92 @@
+import pytest
+
+from entity_index import AhoCorasick, EntityIndex, normalize
+
+ENTITIES = [
+    ("schedule", "CLB101", "Lịch học Khoa CNTT Tuần 1"),
+    ("schedule", "CLB102", "Lịch học Khoa CNTT Tuần 2"),
+    ("schedule", "ABC123", "Lịch học Khoa Toán Tuần 1"),
+    ("schedule", "SCHED2024A", "Lịch thi học kỳ Fall"),
+    ("course", "CS101", "Nhập môn Lập trình"),
+    ("room", "A101", "Phòng lý thuyết A101"),
+    ("room", "A102", "Phòng lý thuyết A102"),
+    ("teacher", "T001", "Nguyễn Văn A"),
+    ("teacher", "T002", "Trần Thị B"),
+    ("teacher", "T010", "Nguyễn Thị Thanh Hùng"),
+    ("teacher", "T011", "Nguyễn Thị Thanh Hồng"),
+    ("teacher", "T020", "Đỗ Minh Quân"),
+    ("teacher", "T021", "Đỗ Minh Quân"),
+]
+
+
+class FakeMySQL:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def stream_entity_version(self):
+        return [{"source": "all", "total": len(self.rows), "changed": None}]
+
+    def stream_entities(self):
+        return [{"kind": k, "code": c, "name": n} for k, c, n in self.rows]
+
+
+@pytest.fixture
+def index():
+    index = EntityIndex(FakeMySQL(ENTITIES), refresh_interval=3600)
+    index.refresh(force=True)
+    index._checked_at = float("inf")
+    return index
+
+
+def codes(resolved, kind):
+    return [e["code"] for e in resolved[kind]]
+
+
+def test_normalize_strips_diacritics_and_punctuation():
+    assert normalize("  Nguyễn Văn  Đạt, phòng A-101? ") == "nguyen van dat phong a 101"
+    assert normalize("ĐỖ MINH QUÂN") == "do minh quan"
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    automaton = AhoCorasick(["he", "she", "his", "hers"])
+    found = {(end, automaton.patterns[i]) for end, i in automaton.find("ushers")}
+    assert found == {(3, "she"), (3, "he"), (5, "hers")}
+
+
+def test_aho_corasick_without_patterns():
+    assert AhoCorasick([]).find("abc") == []
+
+
+def test_resolve_exact_code_and_name(index):
+    resolved = index.resolve("So sánh CLB101 với lịch học khoa CNTT tuần 2")
+    assert codes(resolved, "schedule") == ["CLB101", "CLB102"]
+    assert all(e["score"] == 1.0 for e in resolved["schedule"])
+
+
+def test_resolve_exact_teacher_name(index):
+    assert codes(index.resolve("lịch dạy của Nguyễn Văn A"), "teacher") == ["T001"]
+
+
+def test_resolve_fuzzy_name_with_typo(index):
+    resolved = index.resolve("lich hoc khoa cnt tuan 1")
+    assert codes(resolved, "schedule") == ["CLB101"]
+    assert 0.8 <= resolved["schedule"][0]["score"] < 1.0
+
+
+def test_codes_are_not_fuzzy_matched(index):
+    assert codes(index.resolve("SCHED2024B"), "schedule") == []
+
+
+def test_distinguishing_token_must_match(index):
+    assert codes(index.resolve("Nguyễn Văn B"), "teacher") == []
+    assert codes(index.resolve("phòng lý thuyết A103"), "room") == []
+    assert codes(index.resolve("lịch học khoa cntt tuần 3"), "schedule") == []
+
+
+def test_tied_fuzzy_matches_are_dropped(index):
+    assert codes(index.resolve("giảng viên Nguyễn Thị Thanh Hằng"), "teacher") == []
+
+
+def test_name_shared_by_several_entities_is_not_fuzzy_matched(index):
+    assert codes(index.resolve("thầy Đỗ Minh Quan dạy môn gì"), "teacher") == ["T020", "T021"]
+    assert codes(index.resolve("thầy Đỗ Minh Quann dạy môn gì"), "teacher") == []